@@ -0,0 +1,23 @@
+import random
+
+import pytest
+
+import kernels
+import settings
+
+
+BACKEND_NAMES = ['python'] + (['numba'] if kernels.numba is not None else [])
+
+
+@pytest.fixture(params=BACKEND_NAMES)
+def backend(request, monkeypatch):
+    """
+    Each available kernel backend, which is also made the default one.
+    """
+    monkeypatch.setattr(settings, 'KERNEL_BACKEND', request.param)
+    return kernels.get_backend(request.param)
+
+
+@pytest.fixture(autouse=True)
+def seed():
+    random.seed(0)
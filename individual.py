@@ -1,6 +1,4 @@
-from random import sample
-from itertools import tee
-
+import kernels
 import settings
 
 
@@ -13,46 +11,52 @@ class cached_property:
         self.function = function
 
     def __get__(self, obj, cls):
-        cached_name = 'cached_'+self.function.__name__
-
-        if not hasattr(obj, cached_name):
-            setattr(obj, cached_name, self.function(obj))
-
-        return getattr(obj, cached_name)
-
+        if obj is None:
+            return self
 
-def pairwise(iterable):
-    "s -> (s0,s1), (s1,s2), (s2, s3), ..."
-    # Recipe as seen in itertools module documentation.
-    a, b = tee(iterable)
-    next(b, None)
-    return zip(a, b)
+        # Saved under the property's own name, which takes precedence over
+        # this (non-data) descriptor, so subsequent calls don't even get here
+        value = obj.__dict__[self.function.__name__] = self.function(obj)
+        return value
 
 
 class Individual:
     """
     This class is the "Individual" in Genetic Algorithm's terms.
-    The "path" attribute is the chromosome, while the locations are the genes.
+    The "tour" attribute is the chromosome, while the locations are the genes:
+    it holds their indices in `world.locations` (see kernels.py), and the
+    Locations themselves are only looked up for printing and plotting.
+    Can also be created from a path of Locations.
     """
-    def __init__(self, world, path=set()):
+    def __init__(self, world, tour=None, path=None):
         self.world = world
-        self.path = path
+        self.tour = tour
+        if path is not None:
+            self.tour = kernels.get_backend().as_tour(world.indices_of(path))
+
+    @cached_property
+    def path(self):
+        return self.world.path_from_indices(self.tour)
 
     @cached_property
     def full_path(self):
         return [self.world.hq, *self.path, self.world.hq]
 
+    @cached_property
+    def tour_key(self):
+        return kernels.get_backend().tour_key(self.tour)
+
     @cached_property
     def distance(self):
-        if not self.path:
+        if self.tour is None:
             raise Exception('Individual path is not set.')
         
-        distance = 0
-        for location_a, location_b in pairwise(self.full_path):
-            distance += self.world.distance_between(location_a, location_b)
+        backend = kernels.get_backend()
+        distance = backend.tour_length(self.tour, self.world.distance_matrix)
 
         def should_penalize():
-            if not len(set(self.path)) == settings.NUM_LOCATIONS:
+            if not (len(self.tour) == len(self.world.locations)
+                    and backend.is_permutation(self.tour, backend.new_flags(len(self.tour)))):
                 # Path has to contain all locations
                 return True
             return False
@@ -81,14 +85,12 @@ class Individual:
     @staticmethod
     def have_the_same_path(individual_1, individual_2):
         """
-        Checks if paths are either equal or symmetric
+        Checks if paths are equal
         """
-        reversed_2 = list(individual_2.path)
-        reversed_2.reverse()
-        return individual_1.path == individual_2.path or individual_1 == reversed_2
+        return individual_1.tour_key == individual_2.tour_key
 
     def set_random_path(self):
-        self.path = sample(self.world.locations, settings.NUM_LOCATIONS)
+        self.tour = kernels.get_backend().random_tours(1, len(self.world.locations))[0]
 
     def plot_path(self, axes):
         x = [location.x_coord for location in self.full_path]
@@ -103,11 +105,12 @@ class Generation:
     such as the probabilities of selection of an individual for being
     a parent.
     """
-    def __init__(self, world=None, individuals=[], random=True):
-        self.individuals = individuals
+    def __init__(self, world=None, individuals=None, random=True, config=None):
+        self.individuals = individuals if individuals is not None else []
         self.world = world
+        self.config = config or settings.SimulationConfig()
         if random:
-            self.setup_random_generation(settings.POPULATION_AMOUNT)
+            self.setup_random_generation(self.config.population_amount)
 
     @cached_property
     def total_distance(self):
@@ -129,13 +132,13 @@ class Generation:
     @cached_property
     def individual_probabilities(self):
         probability_dist = []
-        if "roulette" in settings.SELECTION_METHOD.lower():
+        if "roulette" in self.config.selection_method.lower():
             for individual in self.ranked_individuals:
                 probability_dist.append(individual.fitness/self.total_fitness)
         else:
             raise Exception('Invalid selection method.')
         # TODO: fix linear rank probabilities below
-        # elif "rank" in settings.SELECTION_METHOD.lower():
+        # elif "rank" in self.config.selection_method.lower():
         #     total = sum([i for i in range(1, len(self.individuals)+1)])
         #     for index, individual in enumerate(self.ranked_individuals):
         #         probability_dist.append((index+1)/total)
@@ -162,10 +165,8 @@ class Generation:
         return probs
 
     def setup_random_generation(self, num_individuals):
-        for _ in range(num_individuals):
-            individual = Individual(self.world)
-            individual.set_random_path()
-            self.individuals.append(individual)
+        for tour in kernels.get_backend().random_tours(num_individuals, len(self.world.locations)):
+            self.individuals.append(Individual(self.world, tour=tour))
 
     def get_best_individual(self):
         min_distance = min([individual.distance for individual in self.individuals])
@@ -0,0 +1,615 @@
+"""
+Hot loops of the GA (tour length, crossover, mutations and 2-opt moves)
+written over integer tours, i.e. lists/arrays of location indices.
+
+The indices are the positions in `World.locations`, while the last row of
+the distance matrix belongs to the HQ, which is the fixed beginning and
+ending of every tour.
+
+The same functions run either as plain Python or, when Numba is installed,
+compiled to machine code. Compilation results are cached on disk, so new
+processes (i.e. workers) don't pay for it again.
+"""
+import random
+import time
+from math import inf
+from random import randint, sample
+
+import settings
+
+try:
+    import numba
+    import numpy
+except ImportError:
+    numba = None
+
+
+def tour_length(tour, matrix):
+    hq = len(matrix) - 1
+    if len(tour) == 0:
+        # No locations left, HQ -> HQ
+        return 0.0
+    distance = matrix[hq][tour[0]]
+    for i in range(1, len(tour)):
+        distance += matrix[tour[i-1]][tour[i]]
+    distance += matrix[tour[len(tour)-1]][hq]
+    return distance
+
+
+def order_crossover(base_parent, secondary_parent, start, end, child, taken):
+    """
+    Order-1 crossover: the child keeps base_parent[start:end] in place,
+    while the other positions are filled (from left to right) with the
+    remaining genes in the order they appear in the secondary parent.
+    `child` and `taken` are buffers with the same length as the parents.
+    """
+    length = len(base_parent)
+    for i in range(length):
+        taken[i] = False
+
+    for i in range(start, end):
+        child[i] = base_parent[i]
+        taken[base_parent[i]] = True
+
+    j = 0
+    for i in range(length):
+        if start <= i < end:
+            continue
+        while taken[secondary_parent[j]]:
+            j += 1
+        child[i] = secondary_parent[j]
+        taken[secondary_parent[j]] = True
+        j += 1
+    return child
+
+
+def is_permutation(tour, seen):
+    """
+    Whether the tour visits each of its locations (0 to len(tour)-1) once.
+    `seen` is a buffer with the same length as the tour.
+    """
+    for i in range(len(tour)):
+        seen[i] = False
+    for location in tour:
+        if location < 0 or location >= len(tour) or seen[location]:
+            return False
+        seen[location] = True
+    return True
+
+
+def swap(tour, position_1, position_2):
+    tour[position_1], tour[position_2] = tour[position_2], tour[position_1]
+
+
+def invert(tour, start, end):
+    """
+    Reverses tour[start:end+1] in place.
+    """
+    while start < end:
+        tour[start], tour[end] = tour[end], tour[start]
+        start += 1
+        end -= 1
+
+
+def two_opt(tour, matrix):
+    """
+    Applies improving 2-opt moves until none is left.
+    Returns the (negative) total change in the tour length.
+    """
+    # invert() is inlined so this compiles on its own
+    hq = len(matrix) - 1
+    total_delta = 0.0
+    improved = True
+    while improved:
+        improved = False
+        for start in range(len(tour) - 1):
+            for end in range(start + 1, len(tour)):
+                before = tour[start-1] if start > 0 else hq
+                after = tour[end+1] if end < len(tour) - 1 else hq
+                delta = (matrix[before][tour[end]] + matrix[tour[start]][after]
+                         - matrix[before][tour[start]] - matrix[tour[end]][after])
+                if delta < -1e-9:
+                    i, j = start, end
+                    while i < j:
+                        tour[i], tour[j] = tour[j], tour[i]
+                        i += 1
+                        j -= 1
+                    total_delta += delta
+                    improved = True
+    return total_delta
+
+
+def cheapest_insertion(tour, matrix, location):
+    """
+    Position in the tour where inserting `location` adds the least distance.
+    """
+    hq = len(matrix) - 1
+    best_position, best_cost = 0, 0.0
+    for position in range(len(tour) + 1):
+        before = tour[position-1] if position > 0 else hq
+        after = tour[position] if position < len(tour) else hq
+        cost = matrix[before][location] + matrix[location][after] - matrix[before][after]
+        if position == 0 or cost < best_cost:
+            best_position, best_cost = position, cost
+    return best_position
+
+
+def nearest_neighbour(matrix, tour, visited):
+    """
+    Builds a tour by always going to the closest location not visited yet,
+    starting from the HQ. `visited` is a buffer as long as the tour.
+    """
+    hq = len(matrix) - 1
+    for i in range(hq):
+        visited[i] = False
+
+    current = hq
+    for position in range(hq):
+        closest, closest_distance = -1, inf
+        for i in range(hq):
+            if not visited[i] and matrix[current][i] < closest_distance:
+                closest, closest_distance = i, matrix[current][i]
+        tour[position] = closest
+        visited[closest] = True
+        current = closest
+    return tour
+
+
+def held_karp(matrix, costs, parents, tour):
+    """
+    Shortest tour, exactly, through dynamic programming over subsets of
+    locations (as bitmasks). costs[j*half + subset] is the shortest path
+    leaving the HQ, visiting `subset` and ending at j, while parents holds
+    the location visited before j. Leaving j's own bit out of `subset`
+    halves the memory. Writes the tour into `tour` and returns its length.
+    """
+    num_locations = len(matrix) - 1
+    hq = num_locations
+    half = 1 << (num_locations - 1)
+
+    for j in range(num_locations):
+        costs[j*half] = matrix[hq][j]
+        parents[j*half] = -1
+
+    for mask in range(1, 1 << num_locations):
+        if mask & (mask - 1) == 0:
+            # Single locations, set above
+            continue
+        for j in range(num_locations):
+            if not (mask >> j) & 1:
+                continue
+            previous_mask = mask ^ (1 << j)
+            best_cost, best_previous = inf, -1
+            for k in range(num_locations):
+                if not (previous_mask >> k) & 1:
+                    continue
+                subset = ((previous_mask >> (k+1)) << k) | (previous_mask & ((1 << k) - 1))
+                cost = costs[k*half + subset] + matrix[k][j]
+                if cost < best_cost:
+                    best_cost, best_previous = cost, k
+            subset = ((mask >> (j+1)) << j) | (mask & ((1 << j) - 1))
+            costs[j*half + subset] = best_cost
+            parents[j*half + subset] = best_previous
+
+    mask = (1 << num_locations) - 1
+    best_distance, last = inf, -1
+    for j in range(num_locations):
+        subset = ((mask >> (j+1)) << j) | (mask & ((1 << j) - 1))
+        distance = costs[j*half + subset] + matrix[j][hq]
+        if distance < best_distance:
+            best_distance, last = distance, j
+
+    position = num_locations - 1
+    while last != -1:
+        tour[position] = last
+        subset = ((mask >> (last+1)) << last) | (mask & ((1 << last) - 1))
+        mask ^= 1 << last
+        last = parents[last*half + subset]
+        position -= 1
+    return best_distance
+
+
+def one_tree(matrix, penalties, degrees, keys, parents, in_tree):
+    """
+    Length of the minimum 1-tree, with every distance increased by the
+    penalties of both of its ends: a minimum spanning tree of the
+    locations (Prim's algorithm) plus the two shortest edges from the HQ.
+    Fills in the degree of every node in the 1-tree.
+    Needs at least two locations.
+    """
+    hq = len(matrix) - 1
+    for i in range(len(matrix)):
+        degrees[i] = 0
+    for i in range(hq):
+        keys[i] = inf
+        parents[i] = -1
+        in_tree[i] = False
+    keys[0] = 0.0
+
+    length = 0.0
+    for _ in range(hq):
+        node, best_key = -1, inf
+        for i in range(hq):
+            if not in_tree[i] and keys[i] < best_key:
+                node, best_key = i, keys[i]
+        in_tree[node] = True
+        length += best_key
+        if parents[node] != -1:
+            degrees[node] += 1
+            degrees[parents[node]] += 1
+        for i in range(hq):
+            if not in_tree[i]:
+                cost = matrix[node][i] + penalties[node] + penalties[i]
+                if cost < keys[i]:
+                    keys[i] = cost
+                    parents[i] = node
+
+    first, first_cost, second, second_cost = -1, inf, -1, inf
+    for i in range(hq):
+        cost = matrix[hq][i] + penalties[hq] + penalties[i]
+        if cost < first_cost:
+            second, second_cost = first, first_cost
+            first, first_cost = i, cost
+        elif cost < second_cost:
+            second, second_cost = i, cost
+    degrees[hq] = 2
+    degrees[first] += 1
+    degrees[second] += 1
+    return length + first_cost + second_cost
+
+
+class KernelBackend:
+    """
+    Set of kernels plus the helpers to build the containers they work on.
+    """
+    # Above this, the exact solver takes too long (it's exponential)
+    max_exact_locations = 12
+
+    def __init__(self, name, compile_function=None):
+        self.name = name
+        compile_function = compile_function or (lambda function: function)
+
+        self.tour_length = compile_function(tour_length)
+        self.order_crossover = compile_function(order_crossover)
+        self.is_permutation = compile_function(is_permutation)
+        self.swap = compile_function(swap)
+        self.invert = compile_function(invert)
+        self.two_opt = compile_function(two_opt)
+        self.cheapest_insertion = compile_function(cheapest_insertion)
+        self.nearest_neighbour = compile_function(nearest_neighbour)
+        self.held_karp = compile_function(held_karp)
+        self.one_tree = compile_function(one_tree)
+
+    def as_tour(self, indices):
+        return list(indices)
+
+    def as_matrix(self, rows):
+        return [list(row) for row in rows]
+
+    def tour_key(self, tour):
+        """
+        Hashable stand-in of the tour, equal for equal tours.
+        """
+        return tuple(tour)
+
+    def new_tour(self, length):
+        return [0] * length
+
+    def random_tours(self, amount, length):
+        return [sample(range(length), length) for _ in range(amount)]
+
+    def shared_array(self, raw_array):
+        """
+        View of a multiprocessing RawArray the kernels can work on, without copying.
+        """
+        return raw_array
+
+    def shared_matrix(self, raw_array, size):
+        # Rows of plain lists are faster to index than a flat RawArray
+        return [list(raw_array[row*size:(row+1)*size]) for row in range(size)]
+
+    def matrix_insert(self, matrix, index, row):
+        """
+        Adds a location at `index`, whose distances to every location
+        (in the new order, itself included) are `row`.
+        """
+        for position, existing_row in enumerate(matrix):
+            existing_row.insert(index, row[position if position < index else position+1])
+        matrix.insert(index, list(row))
+        return matrix
+
+    def matrix_delete(self, matrix, index):
+        del matrix[index]
+        for existing_row in matrix:
+            del existing_row[index]
+        return matrix
+
+    def matrix_update(self, matrix, index, row):
+        matrix[index] = list(row)
+        for position, existing_row in enumerate(matrix):
+            existing_row[index] = row[position]
+        return matrix
+
+    def new_flags(self, length):
+        return [False] * length
+
+    def new_integers(self, length):
+        return [0] * length
+
+    def new_floats(self, length):
+        return [0.0] * length
+
+    def new_small_integers(self, length):
+        return [0] * length
+
+    def exact_tour(self, matrix):
+        """
+        Shortest tour (Held-Karp) and its length.
+        """
+        num_locations = len(matrix) - 1
+        if not num_locations:
+            return self.new_tour(0), 0.0
+        size = num_locations << (num_locations - 1)
+        tour = self.new_tour(num_locations)
+        distance = self.held_karp(
+            matrix, self.new_floats(size), self.new_small_integers(size), tour)
+        return tour, distance
+
+    def constructive_tour(self, matrix):
+        """
+        A cheap, reasonably good tour: nearest neighbour improved by 2-opt.
+        """
+        num_locations = len(matrix) - 1
+        tour = self.nearest_neighbour(
+            matrix, self.new_tour(num_locations), self.new_flags(num_locations))
+        self.two_opt(tour, matrix)
+        return tour, self.tour_length(tour, matrix)
+
+    def lower_bound(self, matrix, upper_bound=None, iterations=100):
+        """
+        Held-Karp lower bound: no tour is shorter than a 1-tree, and the node
+        penalties are tuned through subgradient optimization to make the
+        1-trees as long (and as tour-like) as possible. The upper bound, the
+        length of a known tour, sets the size of the steps, so the closer it
+        is to the optimal, the tighter the bound: the given one is used only
+        if it beats a constructive tour.
+        """
+        size = len(matrix)
+        if size < 3:
+            return self.exact_tour(matrix)[1]
+
+        constructive_length = self.constructive_tour(matrix)[1]
+        upper_bound = min(upper_bound or constructive_length, constructive_length)
+
+        penalties, degrees = self.new_floats(size), self.new_integers(size)
+        keys, parents, in_tree = self.new_floats(size), self.new_integers(size), self.new_flags(size)
+
+        best_bound, step_scale = 0.0, 2.0
+        for _ in range(iterations):
+            bound = self.one_tree(matrix, penalties, degrees, keys, parents, in_tree) - 2 * sum(penalties)
+            best_bound = max(best_bound, bound)
+
+            subgradient = [degrees[node] - 2 for node in range(size)]
+            norm = sum(value * value for value in subgradient)
+            if not norm:
+                # Every node has 2 edges, i.e. the 1-tree is an optimal tour
+                break
+            step = step_scale * max(upper_bound - bound, 0) / norm
+            for node in range(size):
+                penalties[node] += step * subgradient[node]
+            step_scale *= 0.95
+        return best_bound
+
+    def warm_up(self):
+        """
+        Calls every kernel once, on a tiny instance, so Numba compiles (or
+        loads from its cache) all of them now rather than on their first use.
+        """
+        matrix = self.as_matrix(random_instance(4))
+        tour = self.as_tour([0, 1, 2, 3])
+        self.tour_length(tour, matrix)
+        self.is_permutation(tour, self.new_flags(4))
+        self.crossover(tour, self.as_tour([3, 2, 1, 0]), 1, 3)
+        self.swap(tour, 0, 1)
+        self.invert(tour, 1, 3)
+        self.cheapest_insertion(tour[:3], matrix, tour[3])
+        self.constructive_tour(matrix)
+        self.exact_tour(matrix)
+        self.lower_bound(matrix, iterations=1)
+
+    def crossover(self, base_parent, secondary_parent, start, end):
+        length = len(base_parent)
+        return self.order_crossover(
+            base_parent, secondary_parent, start, end,
+            self.new_tour(length), self.new_flags(length))
+
+    def mutate(self, tour, config):
+        """
+        Performs (at most) one mutation on the tour, in place, based on the
+        config's probabilities (see settings.py).
+        """
+        r = random.random()
+        if r <= config.chance_shuffle_mutation:
+            # Completely shuffles the tour
+            random.shuffle(tour)
+
+        elif r <= config.chance_sequential_swap_mutation:
+            # Swaps a pair of subsequent locations
+            base_index = randint(1, len(tour)-1)
+            self.swap(tour, base_index-1, base_index)
+
+        elif r <= config.chance_random_swap_mutation:
+            # Swaps any pair of locations, not necessarily subsequent.
+            # Can also sometimes just swap a location for itself (i.e. do nothing)
+            self.swap(tour, randint(0, len(tour)-1), randint(0, len(tour)-1))
+
+        elif r <= config.chance_inversion_mutation:
+            # Reverses a section of the tour, i.e. a random 2-opt move
+            start, end = sorted([randint(0, len(tour)-1), randint(0, len(tour)-1)])
+            self.invert(tour, start, end)
+
+
+class NumbaBackend(KernelBackend):
+    max_exact_locations = 20
+
+    def __init__(self):
+        super().__init__('numba', numba.njit(cache=True))
+
+    def as_tour(self, indices):
+        return numpy.array(indices, dtype=numpy.int64)
+
+    def as_matrix(self, rows):
+        return numpy.array(rows, dtype=numpy.float64)
+
+    def tour_key(self, tour):
+        return tour.tobytes()
+
+    def new_tour(self, length):
+        return numpy.empty(length, dtype=numpy.int64)
+
+    def random_tours(self, amount, length):
+        # All at once, from a generator seeded by the random module (so
+        # random.seed() still makes runs reproducible)
+        generator = numpy.random.default_rng(random.getrandbits(64))
+        tours = numpy.tile(numpy.arange(length, dtype=numpy.int64), (amount, 1))
+        return list(generator.permuted(tours, axis=1))
+
+    def shared_array(self, raw_array):
+        return numpy.ctypeslib.as_array(raw_array)
+
+    def shared_matrix(self, raw_array, size):
+        return self.shared_array(raw_array).reshape(size, size)
+
+    def matrix_insert(self, matrix, index, row):
+        new_matrix = numpy.empty((len(row), len(row)), dtype=numpy.float64)
+        others = [position for position in range(len(row)) if position != index]
+        new_matrix[numpy.ix_(others, others)] = matrix
+        return self.matrix_update(new_matrix, index, row)
+
+    def matrix_delete(self, matrix, index):
+        return numpy.delete(numpy.delete(matrix, index, axis=0), index, axis=1)
+
+    def matrix_update(self, matrix, index, row):
+        matrix[index, :] = row
+        matrix[:, index] = row
+        return matrix
+
+    def new_flags(self, length):
+        return numpy.zeros(length, dtype=numpy.bool_)
+
+    def new_integers(self, length):
+        return numpy.zeros(length, dtype=numpy.int64)
+
+    def new_floats(self, length):
+        return numpy.zeros(length, dtype=numpy.float64)
+
+    def new_small_integers(self, length):
+        # Locations' indices, for the exact solver's parents
+        return numpy.zeros(length, dtype=numpy.int8)
+
+
+BACKENDS = {}
+
+
+def get_backend(name=None):
+    """
+    Returns the kernel backend called `name` ("python", "numba" or "auto").
+    Defaults to settings.KERNEL_BACKEND; "auto" picks Numba when it's installed.
+    """
+    name = (name or settings.KERNEL_BACKEND).lower()
+    if name == 'auto':
+        name = 'numba' if numba is not None else 'python'
+
+    if name not in BACKENDS:
+        if name == 'python':
+            BACKENDS[name] = KernelBackend('python')
+        elif name == 'numba':
+            if numba is None:
+                raise ValueError('The numba backend requires numba to be installed.')
+            BACKENDS[name] = NumbaBackend()
+        else:
+            raise ValueError(f'Invalid kernel backend: {name}.')
+    return BACKENDS[name]
+
+
+def random_instance(num_locations):
+    points = [(randint(0, 100), randint(0, 100)) for _ in range(num_locations + 1)]
+    return [
+        [((x_a-x_b)**2 + (y_a-y_b)**2) ** 0.5 for x_b, y_b in points]
+        for x_a, y_a in points
+    ]
+
+
+def benchmark(backend, num_locations=100, rounds=2000):
+    rows = random_instance(num_locations)
+    matrix = backend.as_matrix(rows)
+    parents = [backend.as_tour(sample(range(num_locations), num_locations)) for _ in range(2)]
+    slices = [sorted([randint(0, num_locations), randint(0, num_locations)]) for _ in range(rounds)]
+
+    # First calls trigger (or load the cached) compilation
+    backend.tour_length(parents[0], matrix)
+    backend.crossover(parents[0], parents[1], *slices[0])
+    backend.two_opt(backend.as_tour(list(parents[0])), matrix)
+
+    timings = {}
+    start_time = time.perf_counter()
+    for _ in range(rounds):
+        backend.tour_length(parents[0], matrix)
+    timings['tour_length'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    for start, end in slices:
+        backend.crossover(parents[0], parents[1], start, end)
+    timings['crossover'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    for _ in range(5):
+        backend.two_opt(backend.as_tour(list(parents[1])), matrix)
+    timings['two_opt (x5)'] = time.perf_counter() - start_time
+    return timings
+
+
+def benchmark_simulation(backend_name, num_locations=30, num_generations=1000, seed=0):
+    """
+    Times a whole Simulation.run_simulation.
+    """
+    from simulation import Simulation
+    from world import World
+
+    previous_backend_name, settings.KERNEL_BACKEND = settings.KERNEL_BACKEND, backend_name
+    try:
+        config = settings.SimulationConfig(
+            num_generations=num_generations, exact_solver_max_locations=0,
+            optimality_gap_threshold=None)
+        # Warm up, i.e. load the compiled kernels
+        Simulation(World(num_locations=num_locations), verbose=False, config=config) \
+            .run_simulation(num_generations=10)
+
+        random.seed(seed)
+        sim = Simulation(World(num_locations=num_locations), verbose=False, config=config)
+        start_time = time.perf_counter()
+        sim.run_simulation()
+        return time.perf_counter() - start_time
+    finally:
+        settings.KERNEL_BACKEND = previous_backend_name
+
+
+if __name__ == '__main__':
+    # The kernels' correctness (and equivalence) is checked by test_kernels.py
+    backends = [get_backend('python')]
+    if numba is not None:
+        backends.append(get_backend('numba'))
+    else:
+        print('numba is not installed, benchmarking the python kernels only.')
+
+    results = {backend.name: benchmark(backend) for backend in backends}
+    for kernel in results['python']:
+        line = f'{kernel:>14}: ' + ', '.join(
+            f"{name} {'{0:.4f}s'.format(timings[kernel])}" for name, timings in results.items())
+        if 'numba' in results:
+            line += f" ({'{0:.1f}'.format(results['python'][kernel] / results['numba'][kernel])}x)"
+        print(line)
+
+    print('Whole simulations (30 locations, 1000 generations):')
+    for backend in backends:
+        print(f"{backend.name:>14}: {'{0:.2f}s'.format(benchmark_simulation(backend.name))}")
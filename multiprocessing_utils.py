@@ -13,6 +13,16 @@ def get_last_message(connection: Connection) -> dict:
     return message
 
 
+def get_all_messages(connection: Connection) -> list:
+    messages = []
+    try:
+        while connection.poll():
+            messages.append(connection.recv())
+    except EOFError:
+        pass
+    return messages
+
+
 def get_pipes_messages(pipe_conns: list) -> list:
     messages = []
     for conn in pipe_conns:
@@ -37,7 +47,7 @@ def validate_and_get_num_processes(num_processes: Union[int, str]):
     elif isinstance(num_processes, str):
         if not num_processes == "max":
             raise ValueError(error_string)
-        # leave one CPU as handler
-        return cpu_count() - 1
+        # leave one CPU as handler, unless there's only one
+        return max(cpu_count() - 1, 1)
     else:
         raise ValueError(error_string)
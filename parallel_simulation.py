@@ -0,0 +1,208 @@
+"""
+Parallel evaluation and breeding of a single (large) simulation.
+
+Instead of running independent simulations, the population of one
+simulation is kept in shared memory as integer tours (see kernels.py)
+and a persistent pool of workers breeds and evaluates disjoint shards
+of the offspring every generation. Only shard boundaries and random
+seeds go to the workers, which write the children and their distances
+straight into the shared arrays.
+"""
+import random
+from bisect import bisect_left
+from multiprocessing import Pool, RawArray
+
+import kernels
+import settings
+from individual import Individual
+from simulation import BaseSimulation
+from multiprocessing_utils import validate_and_get_num_processes
+
+
+# Set up in each worker process by init_worker()
+worker_state = {}
+
+
+def init_worker(tours, distances, matrix, population_amount, num_locations, config):
+    backend = kernels.get_backend()
+    worker_state.update({
+        'backend': backend,
+        'tours': backend.shared_array(tours),
+        'distances': backend.shared_array(distances),
+        'matrix': backend.shared_matrix(matrix, num_locations + 1),
+        'population_amount': population_amount,
+        'num_locations': num_locations,
+        'config': config,
+    })
+
+
+def tour_slice(buffer_number, individual_number):
+    """
+    Start and end of an individual's tour inside the shared tours array,
+    which holds two generations (buffers): the parents and the children.
+    """
+    num_locations = worker_state['num_locations']
+    start = (buffer_number * worker_state['population_amount'] + individual_number) * num_locations
+    return start, start + num_locations
+
+
+def distance_index(buffer_number, individual_number):
+    return buffer_number * worker_state['population_amount'] + individual_number
+
+
+def store(buffer_number, individual_number, tour):
+    backend, tours = worker_state['backend'], worker_state['tours']
+    start, end = tour_slice(buffer_number, individual_number)
+    tours[start:end] = tour
+    worker_state['distances'][distance_index(buffer_number, individual_number)] = \
+        backend.tour_length(tour, worker_state['matrix'])
+
+
+def random_shard(buffer_number, start, end, seed):
+    random.seed(seed)
+    backend = worker_state['backend']
+    for individual_number in range(start, end):
+        tour = random.sample(range(worker_state['num_locations']), worker_state['num_locations'])
+        store(buffer_number, individual_number, backend.as_tour(tour))
+
+
+def breed_shard(parents_buffer, start, end, seed):
+    """
+    Fills the children [start, end) of the other buffer, selecting parents
+    through roulette-wheel (the fitter, the likelier) from `parents_buffer`.
+    """
+    random.seed(seed)
+    backend, tours, config = worker_state['backend'], worker_state['tours'], worker_state['config']
+    population_amount, length = worker_state['population_amount'], worker_state['num_locations']
+    children_buffer = 1 - parents_buffer
+
+    cumulative_fitness = []
+    total_fitness = 0
+    for individual_number in range(population_amount):
+        total_fitness += 1 / worker_state['distances'][distance_index(parents_buffer, individual_number)]
+        cumulative_fitness.append(total_fitness)
+
+    def get_parent_number():
+        return min(
+            bisect_left(cumulative_fitness, random.random() * total_fitness), population_amount-1)
+
+    def get_parent(parent_number):
+        return backend.as_tour(tours[slice(*tour_slice(parents_buffer, parent_number))])
+
+    individual_number = start
+    while individual_number < end:
+        parent_number_1, parent_number_2 = get_parent_number(), get_parent_number()
+        for _ in range(10):
+            if parent_number_1 != parent_number_2:
+                break
+            # Parents are the same -- retry second parent
+            parent_number_2 = get_parent_number()
+        parent_1, parent_2 = get_parent(parent_number_1), get_parent(parent_number_2)
+
+        random_slice = sorted([random.randint(0, length), random.randint(0, length)])
+        for base_parent, secondary_parent in ((parent_1, parent_2), (parent_2, parent_1)):
+            if individual_number == end:
+                break
+            child = backend.crossover(base_parent, secondary_parent, *random_slice)
+            backend.mutate(child, config)
+            store(children_buffer, individual_number, child)
+            individual_number += 1
+
+
+class ParallelSimulation(BaseSimulation):
+    """
+    Simulation whose generations are bred and evaluated by a pool of processes.
+    The population lives in shared arrays of location indices rather than
+    in Individual objects, so there's no `generation` (nor the location
+    editing, which repairs it); the best individual and the stats work the
+    same as in Simulation.
+    The population is the elite plus `population_amount - elite_amount` children.
+    """
+    title = 'PARALLEL SIMULATION'
+
+    def __init__(self, world, num_processes="max", process_num=None, verbose=True, config=None):
+        super().__init__(world, process_num, verbose, config)
+        self.num_processes = validate_and_get_num_processes(num_processes)
+
+    def get_shards(self, start, end):
+        # A few shards per process, so faster processes can take more of them
+        num_shards = min(self.num_processes * 4, end - start) or 1
+        bounds = [start + (end - start) * shard // num_shards for shard in range(num_shards + 1)]
+        return list(zip(bounds, bounds[1:]))
+
+    def get_elite(self, distances, buffer_number, amount):
+        """
+        Indices of the best `amount` individuals of the buffer with different distances,
+        a cheap stand-in for Generation.get_elite's different paths.
+        """
+        population_amount = self.config.population_amount
+        offset = buffer_number * population_amount
+        ranked = sorted(range(population_amount), key=lambda number: distances[offset + number])
+
+        elite, elite_distances = [], set()
+        for individual_number in ranked:
+            if len(elite) == amount:
+                break
+            if distances[offset + individual_number] not in elite_distances:
+                elite.append(individual_number)
+                elite_distances.add(distances[offset + individual_number])
+        return elite
+
+    def evolve(self):
+        backend = kernels.get_backend()
+        population_amount = self.config.population_amount
+        elite_amount = min(self.config.elite_amount, population_amount - 1)
+        num_locations = len(self.world.locations)
+
+        raw_tours = RawArray('q', 2 * population_amount * num_locations)
+        raw_distances = RawArray('d', 2 * population_amount)
+        raw_matrix = RawArray('d', (num_locations + 1) ** 2)
+        raw_matrix[:] = [distance for row in self.world.distance_matrix for distance in row]
+        tours, distances = backend.shared_array(raw_tours), backend.shared_array(raw_distances)
+
+        initargs = (raw_tours, raw_distances, raw_matrix, population_amount, num_locations, self.config)
+        with Pool(self.num_processes, initializer=init_worker, initargs=initargs) as pool:
+            pool.starmap(random_shard, [
+                (0, start, end, random.getrandbits(32))
+                for start, end in self.get_shards(0, population_amount)
+            ])
+
+            parents_buffer = 0
+            while True:
+                children_buffer = 1 - parents_buffer
+
+                # The elite is carried over into the first children's places
+                for child_number, parent_number in enumerate(
+                        self.get_elite(distances, parents_buffer, elite_amount)):
+                    parent_start = (parents_buffer * population_amount + parent_number) * num_locations
+                    child_start = (children_buffer * population_amount + child_number) * num_locations
+                    tours[child_start:child_start+num_locations] = \
+                        tours[parent_start:parent_start+num_locations]
+                    distances[children_buffer * population_amount + child_number] = \
+                        distances[parents_buffer * population_amount + parent_number]
+
+                pool.starmap(breed_shard, [
+                    (parents_buffer, start, end, random.getrandbits(32))
+                    for start, end in self.get_shards(elite_amount, population_amount)
+                ])
+
+                # This generation's best
+                offset = children_buffer * population_amount
+                best_number = min(range(population_amount), key=lambda number: distances[offset + number])
+                tour_start = (offset + best_number) * num_locations
+                yield Individual(self.world, tour=backend.as_tour(tours[tour_start:tour_start+num_locations]))
+
+                parents_buffer = children_buffer
+
+if __name__ == '__main__':
+    from world import World, Location
+
+    # More locations than there are names in settings.LOCATION_NAME_LIST
+    world = World(locations=[
+        Location(f'Location {number}', random.randint(0, 1000), random.randint(0, 1000))
+        for number in range(1000)
+    ])
+    config = settings.SimulationConfig(
+        population_amount=10000, elite_amount=10, num_generations=100)
+    sim = ParallelSimulation(world, config=config)
+    sim.run_simulation()
@@ -0,0 +1,432 @@
+"""
+Local asyncio service for solving many TSP instances concurrently.
+
+Jobs are submitted through a tiny stdlib-only HTTP API and scheduled onto
+a bounded pool of long-lived worker processes, each one running a
+`Simulation` per job. Every new best tour found by a worker is streamed
+back to the clients as soon as it is found.
+
+Endpoints:
+    POST   /jobs              submits a job, returns its id (503 if the queue is full)
+    GET    /jobs/<id>         current status and best tour of the job
+    GET    /jobs/<id>/stream  newline-delimited JSON updates until the job finishes
+    DELETE /jobs/<id>         cancels the job
+
+A job's body may contain "locations" (list of {"name", "x", "y"}) or
+"num_locations" for a random world, plus optional "num_generations",
+"config" (overrides of settings.SimulationConfig, i.e. {"elite_amount": 5})
+and "deadline" (in seconds, counted from submission).
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from itertools import count
+from multiprocessing import get_all_start_methods, get_context
+
+import kernels
+import settings
+from simulation import Simulation
+from world import World, Location
+from multiprocessing_utils import get_all_messages, validate_and_get_num_processes
+
+
+# Forked workers would inherit the clients' open sockets, keeping
+# connections alive after the service has closed them.
+mp_context = get_context(
+    'forkserver' if 'forkserver' in get_all_start_methods() else 'spawn')
+if mp_context.get_start_method() == 'forkserver':
+    # Workers are forked from a server which already imported the simulation
+    # (and so matplotlib, numba etc.), instead of importing it on every job
+    mp_context.set_forkserver_preload(['simulation'])
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobConnection:
+    """
+    A worker's pipe, as seen by the simulation of a single job: every
+    message is tagged as an update, and closing it doesn't close the pipe.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+
+    def send(self, message):
+        self.connection.send(('update', message))
+
+    def close(self):
+        pass
+
+
+def run_jobs(connection, stop_event):
+    """
+    Worker process entry point: runs the jobs it receives, one after the
+    other, until the connection is closed. Each job ends with a 'finished'
+    (or 'failed') message.
+    """
+    # Loads the compiled kernels before the first job, not during it
+    kernels.get_backend().warm_up()
+    while True:
+        try:
+            world, config = connection.recv()
+        except EOFError:
+            return
+        try:
+            sim = Simulation(world, verbose=False, config=config)
+            sim.run_simulation(JobConnection(connection), stop_event=stop_event, stream_improvements=True)
+        except Exception as error:
+            connection.send(('failed', repr(error)))
+        else:
+            connection.send(('finished', None))
+
+
+class Worker:
+    """
+    A worker process and the means to talk to it.
+    """
+    def __init__(self):
+        self.connection, child_conn = mp_context.Pipe()
+        self.stop_event = mp_context.Event()
+        self.process = mp_context.Process(
+            target=run_jobs, args=(child_conn, self.stop_event), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def terminate(self):
+        self.process.terminate()
+        self.process.join()
+        self.connection.close()
+
+
+class Job:
+    """
+    A solve request, and everything that has been found for it so far.
+    """
+    FINISHED_STATUSES = ('done', 'cancelled', 'deadline', 'failed')
+
+    def __init__(self, job_id, world, config, deadline=None):
+        self.id = job_id
+        self.world = world
+        self.config = config
+        self.status = 'queued'
+        self.submitted_at = time.monotonic()
+        self.finished_at = None
+        self.deadline_at = self.submitted_at + deadline if deadline else None
+        self.stop_event = asyncio.Event()
+        self.updates = []  # Every improvement, in the order they were found
+        self.changed = asyncio.Condition()
+
+    @property
+    def finished(self):
+        return self.status in self.FINISHED_STATUSES
+
+    @property
+    def deadline_expired(self):
+        return self.deadline_at is not None and time.monotonic() >= self.deadline_at
+
+    def as_dict(self):
+        job = {'id': self.id, 'status': self.status, 'best': None}
+        if self.updates:
+            job['best'] = self.updates[-1]
+        return job
+
+    async def add_update(self, message):
+        path = [self.world.hq, *message['best_individual_path'], self.world.hq]
+        update = {
+            'generation': message['generation'],
+            'best_distance': message['best_distance'],
+            'best_path': [location.name for location in path],
+            'optimality_gap': message.get('optimality_gap'),
+            'elapsed': time.monotonic() - self.submitted_at,
+        }
+        # Checkpoint messages may repeat an already known best
+        if self.updates and self.updates[-1]['best_distance'] <= update['best_distance']:
+            return
+        self.updates.append(update)
+        await self.notify()
+
+    async def set_status(self, status):
+        self.status = status
+        if self.finished:
+            self.finished_at = time.monotonic()
+        await self.notify()
+
+    async def notify(self):
+        async with self.changed:
+            self.changed.notify_all()
+
+
+class SolverService:
+    """
+    Holds the jobs queue and the pool of workers consuming it.
+    At most `num_workers` simulations run at the same time, and at most
+    `max_queued` jobs wait for a free worker; further submissions are refused.
+    A worker which doesn't stop a cancelled job in time is replaced.
+    Finished jobs are forgotten after `finished_ttl` seconds, or sooner
+    (oldest first) when there are more than `max_finished` of them.
+    """
+    def __init__(self, num_workers="max", max_queued=32, poll_interval=0.05, kill_grace=1.0,
+                 finished_ttl=600, max_finished=1000):
+        self.num_workers = validate_and_get_num_processes(num_workers)
+        self.max_queued = max_queued
+        self.poll_interval = poll_interval
+        self.kill_grace = kill_grace  # seconds a stopped worker has before being terminated
+        self.finished_ttl = finished_ttl
+        self.max_finished = max_finished
+        self.jobs = {}
+        self.job_ids = count(1)
+        self.queue = deque()
+        self.jobs_queued = None  # Wakes the workers up, but the queue is what counts
+        self.workers = []
+        self.worker_tasks = []
+
+    async def start(self):
+        self.jobs_queued = asyncio.Semaphore(0)
+        self.workers = [Worker() for _ in range(self.num_workers)]
+        self.worker_tasks = [
+            asyncio.ensure_future(self.consume(worker_number)) for worker_number in range(self.num_workers)
+        ]
+
+    async def stop(self):
+        for job in self.jobs.values():
+            job.stop_event.set()
+        for task in self.worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self.worker_tasks, return_exceptions=True)
+        for worker in self.workers:
+            worker.terminate()
+
+    def prune_finished_jobs(self):
+        finished_jobs = sorted(
+            (job for job in self.jobs.values() if job.finished),
+            key=lambda job: job.finished_at)
+        expired_before = time.monotonic() - self.finished_ttl
+        for position, job in enumerate(finished_jobs):
+            if job.finished_at < expired_before or len(finished_jobs) - position > self.max_finished:
+                del self.jobs[job.id]
+
+    def submit(self, world, config=None, deadline=None):
+        self.prune_finished_jobs()
+        if len(self.queue) >= self.max_queued:
+            raise QueueFull(f'{self.max_queued} jobs are already waiting.')
+        job = Job(
+            str(next(self.job_ids)), world,
+            config or settings.SimulationConfig(), deadline)
+        self.queue.append(job)
+        self.jobs_queued.release()
+        self.jobs[job.id] = job
+        return job
+
+    async def cancel(self, job):
+        job.stop_event.set()
+        if job.status == 'queued':
+            # Frees its place in the queue right away
+            self.queue.remove(job)
+            await job.set_status('cancelled')
+
+    async def consume(self, worker_number):
+        while True:
+            await self.jobs_queued.acquire()
+            if not self.queue:
+                # The job this wake up was for got cancelled
+                continue
+            job = self.queue.popleft()
+            if job.deadline_expired:
+                await job.set_status('deadline')
+                continue
+            await self.run(job, worker_number)
+
+    def replace_worker(self, worker_number):
+        self.workers[worker_number].terminate()
+        self.workers[worker_number] = Worker()
+        return self.workers[worker_number]
+
+    async def run(self, job, worker_number):
+        worker = self.workers[worker_number]
+        if not worker.process.is_alive():
+            # Died while waiting for a job
+            worker = self.replace_worker(worker_number)
+        worker.stop_event.clear()
+        worker.connection.send((job.world, job.config))
+        await job.set_status('running')
+
+        outcome, stop_requested_at = None, None
+        while outcome is None:
+            await asyncio.sleep(self.poll_interval)
+            for kind, message in get_all_messages(worker.connection):
+                if kind == 'update':
+                    await job.add_update(message)
+                else:
+                    outcome = kind
+            if outcome is not None:
+                break
+
+            if not worker.process.is_alive():
+                outcome = 'died'
+            elif stop_requested_at is None and (job.stop_event.is_set() or job.deadline_expired):
+                job.stop_event.set()
+                worker.stop_event.set()
+                stop_requested_at = time.monotonic()
+            elif stop_requested_at and time.monotonic() - stop_requested_at > self.kill_grace:
+                # The worker did not stop by itself in time
+                outcome = 'killed'
+
+        if outcome in ('died', 'killed'):
+            self.replace_worker(worker_number)
+
+        if job.deadline_expired and job.stop_event.is_set():
+            status = 'deadline'
+        elif job.stop_event.is_set():
+            status = 'cancelled'
+        elif outcome in ('failed', 'died') or not job.updates:
+            status = 'failed'
+        else:
+            status = 'done'
+        await job.set_status(status)
+
+    async def stream(self, job):
+        """
+        Yields the job's updates as they happen, until the job is finished.
+        """
+        sent = 0
+        while True:
+            async with job.changed:
+                await job.changed.wait_for(
+                    lambda: len(job.updates) > sent or job.finished)
+            while sent < len(job.updates):
+                yield job.updates[sent]
+                sent += 1
+            if job.finished:
+                yield job.as_dict()
+                return
+
+    # HTTP handling
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            method, target, _ = request_line.decode().split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode().partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            await self.route(method, target.rstrip('/').split('/')[1:], body, writer)
+        except asyncio.IncompleteReadError:
+            write_response(writer, 400, {'error': 'The body is shorter than its Content-Length.'})
+        except (ValueError, TypeError, KeyError, json.JSONDecodeError) as error:
+            write_response(writer, 400, {'error': str(error)})
+        except ConnectionError:
+            pass
+        finally:
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+            writer.close()
+
+    async def route(self, method, parts, body, writer):
+        if parts == ['jobs'] and method == 'POST':
+            request = json.loads(body or b'{}')
+            if not isinstance(request, dict):
+                raise ValueError('The body should be a JSON object.')
+            try:
+                job = self.submit(
+                    world_from_request(request),
+                    config_from_request(request),
+                    deadline_from_request(request))
+            except QueueFull as error:
+                write_response(writer, 503, {'error': str(error)}, {'Retry-After': '1'})
+                return
+            write_response(writer, 202, job.as_dict())
+            return
+
+        if len(parts) not in (2, 3) or parts[0] != 'jobs' or parts[1] not in self.jobs:
+            write_response(writer, 404, {'error': 'Not found.'})
+            return
+
+        job = self.jobs[parts[1]]
+        if len(parts) == 3 and parts[2] == 'stream' and method == 'GET':
+            write_head(writer, 200, 'application/x-ndjson')
+            async for update in self.stream(job):
+                writer.write(json.dumps(update).encode() + b'\n')
+                await writer.drain()
+        elif len(parts) == 2 and method == 'GET':
+            write_response(writer, 200, job.as_dict())
+        elif len(parts) == 2 and method == 'DELETE':
+            await self.cancel(job)
+            write_response(writer, 200, job.as_dict())
+        else:
+            write_response(writer, 405, {'error': 'Method not allowed.'})
+
+    async def serve(self, host='127.0.0.1', port=8080, unix_path=None):
+        await self.start()
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle_connection, unix_path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.stop()
+
+
+def config_from_request(request):
+    overrides = dict(request.get('config', {}))
+    if 'num_generations' in request:
+        overrides['num_generations'] = int(request['num_generations'])
+    return settings.SimulationConfig(**overrides)
+
+
+def deadline_from_request(request):
+    if request.get('deadline') is None:
+        return None
+    deadline = float(request['deadline'])
+    if deadline <= 0:
+        raise ValueError('deadline should be a positive amount of seconds.')
+    return deadline
+
+
+def world_from_request(request):
+    if 'locations' in request:
+        locations = [
+            Location(str(location['name']), float(location['x']), float(location['y']))
+            for location in request['locations']
+        ]
+        if len(set(location.name for location in locations)) != len(locations):
+            raise ValueError('Location names must be unique.')
+        return World(locations=locations)
+    return World(num_locations=int(request.get('num_locations', settings.NUM_LOCATIONS)))
+
+
+REASONS = {
+    200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found',
+    405: 'Method Not Allowed', 503: 'Service Unavailable',
+}
+
+
+def write_head(writer, status, content_type, extra_headers=None):
+    head = [
+        f'HTTP/1.1 {status} {REASONS[status]}',
+        f'Content-Type: {content_type}',
+        'Connection: close',
+    ]
+    head.extend(f'{name}: {value}' for name, value in (extra_headers or {}).items())
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode())
+
+
+def write_response(writer, status, payload, extra_headers=None):
+    body = json.dumps(payload).encode()
+    headers = {'Content-Length': len(body), **(extra_headers or {})}
+    write_head(writer, status, 'application/json', headers)
+    writer.write(body)
+
+
+if __name__ == '__main__':
+    asyncio.run(SolverService().serve())
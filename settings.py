@@ -1,5 +1,6 @@
 NUM_LOCATIONS = 30
 NUM_GENERATIONS = 35000
+WARM_START_GENERATIONS = 3500  # used when re-optimizing after the locations change
 POPULATION_AMOUNT = 50
 
 ELITE_AMOUNT = 3  # amount of individuals carried over to next generation
@@ -12,6 +13,54 @@ SELECTION_METHOD = "Roulette-Wheel"  # Roulette-Wheel or Linear Rank (TODO)
 CHANCE_SHUFFLE_MUTATION = 0.05
 CHANCE_SEQUENTIAL_SWAP_MUTATION = 0.15
 CHANCE_RANDOM_SWAP_MUTATION = 0.25
+CHANCE_INVERSION_MUTATION = 0.35  # reverses a section of the path
+
+# Worlds with up to this many locations are solved exactly instead
+# (at most 12 without numba, as the exact solver is exponential).
+EXACT_SOLVER_MAX_LOCATIONS = 20
+
+# The simulation stops once the best distance is within this fraction of
+# the lower bound, i.e. 0.01 = at most 1% longer than the optimal path.
+# None disables the lower bound computation, which takes a while on big
+# worlds (where the GA rarely gets within 1% of it anyway).
+OPTIMALITY_GAP_THRESHOLD = None
+LOWER_BOUND_ITERATIONS = 100
+
+
+class SimulationConfig:
+    """
+    GA parameters of a single Simulation.
+    Defaults to the module-level settings above, while keyword
+    arguments override them, i.e. SimulationConfig(elite_amount=5).
+    """
+    def __init__(self, **overrides):
+        self.num_generations = NUM_GENERATIONS
+        self.warm_start_generations = WARM_START_GENERATIONS
+        self.population_amount = POPULATION_AMOUNT
+        self.elite_amount = ELITE_AMOUNT
+        self.selection_method = SELECTION_METHOD
+        self.chance_shuffle_mutation = CHANCE_SHUFFLE_MUTATION
+        self.chance_sequential_swap_mutation = CHANCE_SEQUENTIAL_SWAP_MUTATION
+        self.chance_random_swap_mutation = CHANCE_RANDOM_SWAP_MUTATION
+        self.chance_inversion_mutation = CHANCE_INVERSION_MUTATION
+        self.exact_solver_max_locations = EXACT_SOLVER_MAX_LOCATIONS
+        self.optimality_gap_threshold = OPTIMALITY_GAP_THRESHOLD
+
+        for name, value in overrides.items():
+            if not hasattr(self, name):
+                raise ValueError(f'Invalid simulation setting: {name}.')
+            setattr(self, name, value)
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    def __repr__(self):
+        return f'SimulationConfig({self.as_dict()})'
+
+
+# Backend for the hot loops in kernels.py: "python", "numba" or "auto",
+# where "auto" uses numba only if it's installed.
+KERNEL_BACKEND = "auto"
 
 # These are actually male dog names... but that doesn't matter.
 LOCATION_NAME_LIST = [
@@ -1,11 +1,14 @@
 import os
 import time
+from bisect import bisect_left
+from math import inf
 from concurrent.futures import ThreadPoolExecutor
 from multiprocessing import Process, Pipe
-from random import randint, random, shuffle
+from random import randint, random
 
 from matplotlib import pyplot, animation
 
+import kernels
 import settings
 from individual import Individual, Generation
 from world import World
@@ -14,59 +17,274 @@ from multiprocessing_utils import (
     validate_and_get_num_processes)
 
 
-class Simulation:
+class PopulationConverged(Exception):
     """
-    Controller class for the simulation in general, that is,
-    contains the loop which creates and evaluates generations,
-    performs the crossovers, mutations.
+    All the individuals of a generation have the same path.
+    """
+
+
+class BaseSimulation:
     """
-    def __init__(self, world, process_num=None):
+    What every kind of simulation has in common, that is, the loop which
+    evaluates the generations, keeps the best individual across them and
+    reports the stats. Subclasses create the generations, through evolve().
+    """
+    title = 'SIMULATION'
+
+    def __init__(self, world, process_num=None, verbose=True, config=None):
         self.world = world
-        self.generation = Generation(world, random=True)
+        self.config = config or settings.SimulationConfig()
         self.process_string = f"(Process {process_num})" if process_num else ""
+        self.verbose = verbose
+        self.num_generations = self.config.num_generations
+        self.lower_bound = None
+        self.optimality_gap = None
 
         self.best_distances = []  # Best results for each generation
 
-    def run_simulation(self, pipe_conn=None):
-        print(f'--- STARTING SIMULATION {self.process_string}---')
+    def evolve(self):
+        """
+        Generator which creates a new generation whenever asked for the next
+        one, yielding its best individual. Raises PopulationConverged when
+        no new generation can be created.
+        """
+        raise NotImplementedError
 
-        for generation_number in range(1, settings.NUM_GENERATIONS+1):
-            # Creates a new generation based on the previous one
-            self.generation = Generation(self.world, self.get_new_individuals(self.generation))
+    def run_simulation(self, pipe_conn=None, stop_event=None,
+                       num_generations=None, stream_improvements=False):
+        """
+        Runs the generations loop.
+        `stop_event` (anything with an `is_set()` method, such as a
+        multiprocessing.Event) is checked once per generation, so callers can
+        cooperatively cancel the run. With `stream_improvements`, every new
+        best individual is sent through `pipe_conn` as soon as it is found,
+        instead of only at the periodic checkpoints.
+        """
+        # This run's length only, self.num_generations stays the configured one
+        num_generations = num_generations or self.num_generations
+
+        if self.verbose:
+            print(f'--- STARTING {self.title} {self.process_string}---')
+
+        if self.try_exact_solution(pipe_conn):
+            return
+
+        generations = self.evolve()
+        for generation_number in range(1, num_generations+1):
+            if stop_event is not None and stop_event.is_set():
+                break
+
+            try:
+                this_best_individual = next(generations)
+            except PopulationConverged:
+                if self.verbose:
+                    print('Population has converged. Finishing simulation.')
+                break
 
             # This generation's results
-            this_best_individual = self.generation.get_best_individual()
             this_best_distance = this_best_individual.distance
 
             # Saves the result if it's the best one so far, across generations
-            if generation_number == 1 or this_best_distance < self.best_distance:
+            improved = generation_number == 1 or this_best_distance < self.best_distance
+            if improved:
                 self.best_distance = this_best_distance
                 self.best_individual = this_best_individual
 
             self.best_distances.append(this_best_distance)
 
-            self.print_stats(generation_number, this_best_distance)
+            if pipe_conn and generation_number == 1:
+                # The first answer doesn't wait for reached_optimality_gap()
+                # to compute the lower bound, which takes a while on big worlds
+                pipe_conn.send(self.progress_message(generation_number))
+            finished = self.reached_optimality_gap()
 
-            if pipe_conn:
-                if generation_number%(settings.NUM_GENERATIONS/200) == 0:
-                    pipe_conn.send({
-                        'best_distance': self.best_distance,
-                        'best_individual_path': self.best_individual.path
-                    })
+            if self.verbose:
+                self.print_stats(generation_number, this_best_distance, num_generations, finished)
 
-                if generation_number == settings.NUM_GENERATIONS:
-                    pipe_conn.close()
+            if pipe_conn and (generation_number > 1 or finished):
+                checkpoint = generation_number%(num_generations/200) == 0
+                if checkpoint or finished or (stream_improvements and improved):
+                    pipe_conn.send(self.progress_message(generation_number))
+
+            if finished:
+                break
 
             # if self.has_converged():
                 # break
 
+        # Lets evolve() clean up, i.e. close its pool of processes
+        generations.close()
+        if pipe_conn:
+            pipe_conn.close()
+
+    def try_exact_solution(self, pipe_conn=None):
+        """
+        Small worlds are solved exactly, instead of through the GA.
+        Returns whether that was the case.
+        """
+        if not self.world.can_be_solved_exactly(self.config.exact_solver_max_locations):
+            return False
+
+        tour, distance = self.world.exact_solution()
+        self.best_individual = Individual(self.world, tour=tour)
+        self.best_distance = self.lower_bound = distance
+        self.optimality_gap = 0.0
+        self.best_distances.append(distance)
+
+        if self.verbose:
+            self.print_stats(0, distance, self.num_generations, finished=True)
+        if pipe_conn:
+            pipe_conn.send(self.progress_message(0))
+            pipe_conn.close()
+        return True
+
+    def reached_optimality_gap(self):
+        """
+        Updates the optimality gap, that is, how much longer than the lower
+        bound the best path is (so the optimal path is at most that longer),
+        and tells whether it's within the configured threshold.
+        """
+        if self.config.optimality_gap_threshold is None:
+            return False
+        if self.lower_bound is None:
+            # Computed once, its step sizes come from the best of the
+            # current distance and a constructive (nearest neighbour + 2-opt) one
+            self.lower_bound = self.world.lower_bound(upper_bound=self.best_distance)
+
+        if self.lower_bound > 0:
+            self.optimality_gap = max(self.best_distance / self.lower_bound - 1, 0.0)
+        else:
+            # i.e. every location is on the HQ
+            self.optimality_gap = 0.0 if self.best_distance <= 0 else inf
+        return self.optimality_gap <= self.config.optimality_gap_threshold
+
+    def progress_message(self, generation_number):
+        return {
+            'generation': generation_number,
+            'best_distance': self.best_distance,
+            'best_individual_path': self.best_individual.path,
+            'optimality_gap': self.optimality_gap,
+        }
+
+    def has_converged(self):
+        if not self.best_distances:
+            return False
+
+        distances = list(self.best_distances)
+        distances.reverse()
+
+        last_result = distances[0]
+        for i, distance in enumerate(distances):
+            # TODO: better verification of convergence
+            if i >= 50:
+                return True
+            if distance != last_result:
+                return False
+
+    def print_stats(self, generation_number, this_best_distance, num_generations, finished=False):
+        if self.optimality_gap is None:
+            gap_string = ''
+        elif self.optimality_gap == 0 and generation_number == 0:
+            gap_string = 'Solved exactly, this is the optimal path.'
+        else:
+            gap_string = f'Optimality gap: at most {"{0:.2f}%".format(100*self.optimality_gap)}'
+
+        if finished or generation_number == num_generations:
+            print(f'\n\n--- END OF SIMULATION {self.process_string} ---')
+            print(f"Best individual's distance: {'{0:.2f}m'.format(self.best_distance)}")
+            print(f"Best individual's path: {self.best_individual.printable_path}")
+            if gap_string:
+                print(gap_string)
+        elif generation_number%(num_generations/100) == 0:
+            print(f'\nGeneration number {generation_number} {self.process_string}')
+            print(f'Best across generations: {"{0:.2f}m".format(self.best_distance)}')
+            print(f'Best of generation {generation_number}: {"{0:.2f}m".format(this_best_distance)}')
+            if gap_string:
+                print(gap_string)
+            # print(f'List of distances: {["{0:.2f}m".format(t.distance) for t in self.generation.ranked_individuals]}')
+
+
+class Simulation(BaseSimulation):
+    """
+    Controller class for the simulation in general, that is,
+    creates the generations, performs the crossovers, mutations.
+    Its generation can also be repaired after the locations change.
+    """
+    def __init__(self, world, process_num=None, verbose=True, config=None):
+        super().__init__(world, process_num, verbose, config)
+        self.generation = Generation(world, random=True, config=self.config)
+
+    def evolve(self):
+        while True:
+            # Creates a new generation based on the previous one
+            self.generation = Generation(
+                self.world, self.get_new_individuals(self.generation), config=self.config)
+            yield self.generation.get_best_individual()
+
+    def add_location(self, location):
+        previous_locations = list(self.world.locations)
+        self.world.add_location(location)
+        self.repair_generation(previous_locations)
+
+    def remove_location(self, name):
+        previous_locations = list(self.world.locations)
+        self.world.remove_location(name)
+        self.repair_generation(previous_locations)
+
+    def move_location(self, name, x, y):
+        self.world.move_location(name, x, y)
+        self.repair_generation(list(self.world.locations), reinsert=[name])
+
+    def repair_generation(self, previous_locations, reinsert=()):
+        """
+        Fixes the current generation's tours after the world has changed,
+        so the evolution can continue from them instead of from scratch.
+        The tours are indices of `previous_locations`, the world's locations
+        before the change: removed locations are dropped from them, while new
+        ones (and the ones in `reinsert`) are put where they add the least distance.
+        """
+        backend = kernels.get_backend()
+        matrix = self.world.distance_matrix
+        indices = self.world.indices_by_name()
+        # Index before the change -> index now, None for the ones to drop
+        current_indices = [
+            None if location.name in reinsert else indices.get(location.name)
+            for location in previous_locations
+        ]
+
+        repaired_individuals = []
+        for individual in self.generation.individuals:
+            tour = [
+                current_indices[index] for index in individual.tour
+                if current_indices[index] is not None
+            ]
+            missing = set(range(len(self.world.locations))) - set(tour)
+            for index in missing:
+                position = backend.cheapest_insertion(backend.as_tour(tour), matrix, index)
+                tour.insert(position, index)
+            repaired_individuals.append(Individual(self.world, tour=backend.as_tour(tour)))
+
+        self.generation = Generation(
+            self.world, repaired_individuals, random=False, config=self.config)
+        self.best_individual = self.generation.get_best_individual()
+        self.best_distance = self.best_individual.distance
+        self.lower_bound = None
+
+    def reoptimize(self, num_generations=None, **kwargs):
+        """
+        Continues evolving the current (i.e. repaired) generation
+        for a shorter amount of generations than a cold start.
+        """
+        self.run_simulation(
+            num_generations=num_generations or self.config.warm_start_generations, **kwargs)
+
     def run_multiprocess_simulation(self, num_processes):
         world = getattr(self, 'world', World())
         pipe_conns, processes = [], []
 
         for process_num in range(1, num_processes+1):
             # Prepares a new simulation in this world
-            sim = Simulation(world, process_num)
+            sim = Simulation(world, process_num, config=self.config)
 
             # Pipes for receiving the results
             parent_conn, child_conn = Pipe()
@@ -109,21 +327,6 @@ class Simulation:
             self.best_individual = best_individual
 
 
-    def has_converged(self):
-        if not self.best_distances:
-            return False
-
-        distances = list(self.best_distances)
-        distances.reverse()
-
-        last_result = distances[0]
-        for i, distance in enumerate(distances):
-            # TODO: better verification of convergence
-            if i >= 50:
-                return True
-            if distance != last_result:
-                return False
-
     def get_new_individuals(self, generation):
         """
         Provides a new list of individuals, based on the given generation.
@@ -132,24 +335,22 @@ class Simulation:
         """
         new_individuals = []
 
-        if settings.ELITE_AMOUNT:
+        if self.config.elite_amount:
             new_individuals.extend(
-                generation.get_elite(settings.ELITE_AMOUNT)
+                generation.get_elite(self.config.elite_amount)
             )
 
-        if len(set([str(t.printable_path) for t in generation.individuals])) == 1:
+        if len(set([individual.tour_key for individual in generation.individuals])) == 1:
             # This weird 'if' above will be True in case all the individuals are equal
-            print('Population has converged. Finishing simulation.')
-            exit()
+            raise PopulationConverged()
 
         def get_parent_index():
             # Selects a parent (through the index),
-            # based on the probability distribution.
+            # based on the probability distribution,
+            # i.e. the i for which probs[i] < r <= probs[i+1].
             r = random()
             probs = generation.cumulative_probabilities
-            for i in range(len(probs)):
-                if probs[i] < r <= probs[i+1]:
-                    return i
+            return min(max(bisect_left(probs, r) - 1, 0), len(probs) - 2)
 
         # Runs until we have the correct amount of individuals for this generation
         while True:
@@ -160,16 +361,16 @@ class Simulation:
                 # Parents are the same -- retry second parent
                 parent_2 = generation.ranked_individuals[get_parent_index()]
 
-            child_a, child_b = Individual(self.world), Individual(self.world)
-
-            child_a_path, child_b_path = self.crossover(parent_1, parent_2)
-            self.mutate(child_a_path)
-            self.mutate(child_b_path)
-            child_a.path, child_b.path = child_a_path, child_b_path
+            child_a_tour, child_b_tour = self.crossover(parent_1, parent_2)
+            self.mutate(child_a_tour, self.config)
+            self.mutate(child_b_tour, self.config)
 
-            new_individuals.extend([child_a, child_b])
-            if len(new_individuals) >= settings.POPULATION_AMOUNT:
-                new_individuals = new_individuals[0:settings.POPULATION_AMOUNT+1]
+            new_individuals.extend([
+                Individual(self.world, tour=child_a_tour),
+                Individual(self.world, tour=child_b_tour),
+            ])
+            if len(new_individuals) >= self.config.population_amount:
+                new_individuals = new_individuals[0:self.config.population_amount+1]
                 break
 
         return new_individuals
@@ -177,71 +378,26 @@ class Simulation:
     @staticmethod
     def crossover(individual_a, individual_b):
         """
-        Order-1 type crossover operation.
+        Order-1 type crossover operation, returns the children's tours.
         """
-        length = len(individual_a.path)
-
-        chromosome_a = individual_a.path
-        chromosome_b = individual_b.path
+        length = len(individual_a.tour)
+        backend = kernels.get_backend()
 
         random_slice = [randint(0, length), randint(0, length)]
         random_slice.sort()
 
-        slice_negative = [
-            index for index in range(settings.NUM_LOCATIONS)
-            if index not in range(*random_slice)
-        ]
-
-        def get_child_chromosome(base_parent, secondary_parent):
-            # TODO: this method is responsible for >50% of execution time
-            # in a simulation. Find a way to improve performance.
-            secondary_parent = tuple(secondary_parent)
-            child_chromosome = [None] * settings.NUM_LOCATIONS
-            child_chromosome[random_slice[0]:random_slice[1]] = base_parent[random_slice[0]:random_slice[1]]
-
-            for index in slice_negative:
-                child_chromosome[index] = next(
-                    allel_b for allel_b in secondary_parent
-                    if not allel_b in child_chromosome  # non-duplicates only
-                )
-            return child_chromosome
-
         # TODO: re-initialize random_slice?
-        return get_child_chromosome(chromosome_a, chromosome_b), get_child_chromosome(chromosome_b, chromosome_a)
+        return (
+            backend.crossover(individual_a.tour, individual_b.tour, *random_slice),
+            backend.crossover(individual_b.tour, individual_a.tour, *random_slice),
+        )
 
     @staticmethod
-    def mutate(chromosome):
+    def mutate(chromosome, config=None):
         """
-        Performs mutations on the chromosome based on the settings' probabilities.
+        Performs mutations on the chromosome (a tour) based on the config's probabilities.
         """
-        def swap_allels(position1, position2):
-            chromosome[position1], chromosome[position2] = chromosome[position2], chromosome[position1]
-
-        r = random()
-        if r <= settings.CHANCE_SHUFFLE_MUTATION:
-            # Completely shuffles the chromosome
-            shuffle(chromosome)
-
-        elif r <= settings.CHANCE_SEQUENTIAL_SWAP_MUTATION:
-            # Swaps a pair of subsequent allels
-            base_index = randint(1, len(chromosome)-1)
-            swap_allels(base_index-1, base_index)
-
-        elif r <= settings.CHANCE_RANDOM_SWAP_MUTATION:
-            # Swaps any pair of allels, not necessarily subsequent.
-            # Can also sometimes just swap an allel for itself (i.e. do nothing)
-            swap_allels(randint(0, len(chromosome)-1), randint(0, len(chromosome)-1))
-
-    def print_stats(self, generation_number, this_best_distance):
-        if generation_number == settings.NUM_GENERATIONS:
-            print(f'\n\n--- END OF SIMULATION {self.process_string} ---')
-            print(f"Best individual's distance: {'{0:.2f}m'.format(self.best_distance)}")
-            print(f"Best individual's path: {self.best_individual.printable_path}")
-        elif generation_number%(settings.NUM_GENERATIONS/100) == 0:
-            print(f'\nGeneration number {generation_number} {self.process_string}')
-            print(f'Best across generations: {"{0:.2f}m".format(self.best_distance)}')
-            print(f'Best of generation {generation_number}: {"{0:.2f}m".format(this_best_distance)}')
-            # print(f'List of distances: {["{0:.2f}m".format(t.distance) for t in self.generation.ranked_individuals]}')
+        kernels.get_backend().mutate(chromosome, config or settings.SimulationConfig())
 
 
 def run_basic_simulation():
@@ -274,11 +430,12 @@ def run_plotted_simulation(num_processes="max"):
     input("Showing map possibilities. Press [enter] to proceed.")
 
     # Initializes a random generation
-    generation = Generation(world=world)
-    generation.setup_random_generation(settings.POPULATION_AMOUNT)
+    config = settings.SimulationConfig()
+    generation = Generation(world=world, config=config)
+    generation.setup_random_generation(config.population_amount)
 
     # Prepares the simulation to be started
-    sim = Simulation(world)
+    sim = Simulation(world, config=config)
 
     def animate(i):
         base_axes.clear()
@@ -0,0 +1,209 @@
+"""
+Parameter sweeps: finds the SimulationConfig that does best on a set of
+benchmark worlds, running the simulations on a pool of processes.
+
+Candidates are evaluated through successive halving: all of them get a
+small amount of generations, only the best fraction of them survives to
+the next round, which has a bigger budget, and so on. This way bad
+configurations are discarded before spending much CPU time on them.
+"""
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from statistics import mean
+
+import settings
+from simulation import Simulation
+from world import World
+from multiprocessing_utils import validate_and_get_num_processes
+
+
+def grid(**options):
+    """
+    Every combination of the given options, i.e.
+    grid(elite_amount=[1, 3], population_amount=[50, 100]) -> 4 overrides.
+    """
+    names = list(options)
+    return [dict(zip(names, values)) for values in product(*options.values())]
+
+
+def random_sample(amount, **options):
+    """
+    `amount` random (and unique, as far as possible) combinations of the given options.
+    """
+    all_overrides = grid(**options)
+    return random.sample(all_overrides, min(amount, len(all_overrides)))
+
+
+def benchmark_worlds(amount=3, num_locations=settings.NUM_LOCATIONS, seed=0):
+    """
+    Random worlds, but always the same ones for the same seed.
+    """
+    state = random.getstate()
+    random.seed(seed)
+    worlds = [World(num_locations=num_locations) for _ in range(amount)]
+    random.setstate(state)
+    return worlds
+
+
+def evaluate(overrides, world, num_generations, seed):
+    """
+    Runs a single simulation. This is what the pool's processes execute.
+    The exact solver and the gap-based stopping are off (unless overridden),
+    as they would skip or cut short the GA being measured.
+    """
+    random.seed(seed)
+    config = settings.SimulationConfig(**{
+        'exact_solver_max_locations': 0,
+        'optimality_gap_threshold': None,
+        **overrides,
+    })
+    sim = Simulation(world, verbose=False, config=config)
+
+    start_time = time.process_time()
+    sim.run_simulation(num_generations=num_generations)
+    cpu_time = time.process_time() - start_time
+
+    return {
+        'best_distance': sim.best_distance,
+        'best_distances': sim.best_distances,
+        'cpu_time': cpu_time,
+    }
+
+
+class Candidate:
+    """
+    A configuration being raced, and its results in the latest round it ran.
+    """
+    def __init__(self, overrides):
+        self.overrides = overrides
+        self.results = []  # One per benchmark world
+        self.rounds = 0
+        self.score = None
+        self.relative_distance = None
+        self.cpu_time = None
+        self.targets_missed = None
+        self.cpu_time_to_target = None
+
+    def time_to_target(self, result, target):
+        """
+        CPU time spent until the run got below `target`, assuming
+        every generation takes the same time. None if it never did.
+        """
+        for generation_number, distance in enumerate(result['best_distances'], 1):
+            if distance <= target:
+                return result['cpu_time'] * generation_number / len(result['best_distances'])
+        return None
+
+    def evaluate_results(self, best_known, target_gap):
+        """
+        The smaller the score, the better. Distances are relative to the
+        best known distance of each world, so every world weights the same.
+        """
+        relative_distances = [
+            result['best_distance'] / best for result, best in zip(self.results, best_known)
+        ]
+        self.relative_distance = mean(relative_distances)
+        self.cpu_time = sum(result['cpu_time'] for result in self.results)
+
+        if target_gap is None:
+            self.score = (self.relative_distance, self.cpu_time)
+            return
+
+        times = [
+            self.time_to_target(result, best * (1 + target_gap))
+            for result, best in zip(self.results, best_known)
+        ]
+        reached = [cpu_time for cpu_time in times if cpu_time is not None]
+        self.targets_missed = len(times) - len(reached)
+        self.cpu_time_to_target = sum(reached) if reached else None
+        self.score = (self.targets_missed, self.cpu_time_to_target or 0, self.relative_distance)
+
+    def as_dict(self):
+        row = {
+            'config': self.overrides,
+            'rounds': self.rounds,
+            'relative_distance': self.relative_distance,
+            'cpu_time': self.cpu_time,
+        }
+        if self.targets_missed is not None:
+            row['targets_missed'] = self.targets_missed
+            row['cpu_time_to_target'] = self.cpu_time_to_target
+        return row
+
+
+def successive_halving(candidates_overrides, worlds, min_generations=200, max_generations=None,
+                       keep_fraction=0.5, target_gap=None, num_processes="max", seed=0):
+    """
+    Races the configurations (list of SimulationConfig overrides) on the worlds.
+    Each round runs the surviving candidates for twice the generations of the
+    previous one, keeping only `keep_fraction` of them, until one is left or
+    `max_generations` is reached.
+    With `target_gap` (i.e. 0.05), candidates are ranked by the CPU time they
+    took to get within that gap of the best known distance of each world.
+    Returns the ranked report, beginning with the best configuration.
+    """
+    num_processes = validate_and_get_num_processes(num_processes)
+    max_generations = max_generations or settings.NUM_GENERATIONS
+    candidates = [Candidate(overrides) for overrides in candidates_overrides]
+    eliminated = []
+    best_known = [float('inf')] * len(worlds)
+
+    num_generations = min_generations
+    with ProcessPoolExecutor(max_workers=num_processes) as executor:
+        while True:
+            futures = {
+                (candidate_index, world_index): executor.submit(
+                    evaluate, candidate.overrides, world, num_generations, seed + world_index)
+                for candidate_index, candidate in enumerate(candidates)
+                for world_index, world in enumerate(worlds)
+            }
+            for candidate_index, candidate in enumerate(candidates):
+                candidate.results = [
+                    futures[candidate_index, world_index].result()
+                    for world_index in range(len(worlds))
+                ]
+                candidate.rounds += 1
+                for world_index, result in enumerate(candidate.results):
+                    best_known[world_index] = min(best_known[world_index], result['best_distance'])
+
+            for candidate in candidates:
+                candidate.evaluate_results(best_known, target_gap)
+            candidates.sort(key=lambda candidate: candidate.score)
+
+            if len(candidates) == 1 or num_generations >= max_generations:
+                break
+
+            survivors = max(1, int(len(candidates) * keep_fraction))
+            eliminated = candidates[survivors:] + eliminated
+            candidates = candidates[:survivors]
+            num_generations = min(num_generations * 2, max_generations)
+
+    # Candidates which lasted longer rank above the ones eliminated before them
+    return [candidate.as_dict() for candidate in candidates + eliminated]
+
+
+def print_report(report):
+    for position, row in enumerate(report, 1):
+        line = (
+            f"{position:>3}. rounds {row['rounds']}, "
+            f"distance {'{0:.3f}'.format(row['relative_distance'])}x best known, "
+            f"CPU {'{0:.1f}s'.format(row['cpu_time'])}"
+        )
+        if row.get('cpu_time_to_target') is not None:
+            line += f", to target {'{0:.1f}s'.format(row['cpu_time_to_target'])}"
+        if row.get('targets_missed'):
+            line += f", missed {row['targets_missed']} target(s)"
+        print(f"{line} -- {row['config']}")
+
+
+if __name__ == '__main__':
+    candidates = grid(
+        population_amount=[30, 50, 100],
+        elite_amount=[1, 3, 5],
+        chance_random_swap_mutation=[0.25, 0.4],
+    )
+    report = successive_halving(
+        candidates, benchmark_worlds(), min_generations=100, max_generations=1600, target_gap=0.05)
+    print_report(report)
@@ -0,0 +1,159 @@
+import random
+from itertools import permutations
+
+import pytest
+
+import kernels
+import settings
+
+
+def random_tour(num_locations):
+    return random.sample(range(num_locations), num_locations)
+
+
+def path_length(tour, rows):
+    """
+    Tour length straight from its definition, HQ -> tour -> HQ.
+    """
+    stops = [len(rows) - 1, *tour, len(rows) - 1]
+    return sum(rows[stops[i]][stops[i+1]] for i in range(len(stops) - 1))
+
+
+def test_tour_length(backend):
+    rows = kernels.random_instance(20)
+    for _ in range(20):
+        tour = random_tour(20)
+        assert backend.tour_length(backend.as_tour(tour), backend.as_matrix(rows)) \
+            == pytest.approx(path_length(tour, rows))
+
+
+def test_is_permutation(backend):
+    assert backend.is_permutation(backend.as_tour([2, 0, 1]), backend.new_flags(3))
+    assert not backend.is_permutation(backend.as_tour([2, 0, 2]), backend.new_flags(3))
+    assert not backend.is_permutation(backend.as_tour([3, 0, 1]), backend.new_flags(3))
+
+
+def test_crossover(backend):
+    for _ in range(50):
+        parent_a, parent_b = random_tour(15), random_tour(15)
+        start, end = sorted([random.randint(0, 15), random.randint(0, 15)])
+        child = list(backend.crossover(backend.as_tour(parent_a), backend.as_tour(parent_b), start, end))
+
+        assert child[start:end] == parent_a[start:end]
+        kept = set(parent_a[start:end])
+        assert child[:start] + child[end:] == [gene for gene in parent_b if gene not in kept]
+
+
+def test_swap_and_invert(backend):
+    tour, expected = backend.as_tour(range(10)), list(range(10))
+    backend.swap(tour, 2, 7)
+    expected[2], expected[7] = expected[7], expected[2]
+    assert list(tour) == expected
+
+    backend.invert(tour, 1, 5)
+    expected[1:6] = reversed(expected[1:6])
+    assert list(tour) == expected
+
+
+@pytest.mark.parametrize('mutation', ['shuffle', 'sequential_swap', 'random_swap', 'inversion'])
+def test_mutate_keeps_permutations(backend, mutation):
+    # Only `mutation` has a chance of happening
+    chances = {}
+    for name in ['shuffle', 'sequential_swap', 'random_swap', 'inversion']:
+        chances[f'chance_{name}_mutation'] = 1.0 if name == mutation else 0.0
+    config = settings.SimulationConfig(**chances)
+
+    changed = False
+    for _ in range(50):
+        tour = backend.as_tour(range(12))
+        backend.mutate(tour, config)
+        assert sorted(tour) == list(range(12))
+        changed = changed or list(tour) != list(range(12))
+    assert changed
+
+
+def test_random_tours(backend):
+    tours = backend.random_tours(20, 12)
+    assert len(tours) == 20
+    assert all(sorted(tour) == list(range(12)) for tour in tours)
+    assert len(set(backend.tour_key(tour) for tour in tours)) > 1
+
+
+def test_two_opt(backend):
+    rows = kernels.random_instance(30)
+    matrix = backend.as_matrix(rows)
+    tour = backend.as_tour(random_tour(30))
+    length = path_length(list(tour), rows)
+
+    delta = backend.two_opt(tour, matrix)
+
+    assert sorted(tour) == list(range(30))
+    assert length + delta == pytest.approx(path_length(list(tour), rows))
+    # No improving move is left
+    for start in range(29):
+        for end in range(start + 1, 30):
+            moved = list(tour)
+            moved[start:end+1] = reversed(moved[start:end+1])
+            assert path_length(moved, rows) >= path_length(list(tour), rows) - 1e-6
+
+
+def test_cheapest_insertion(backend):
+    rows = kernels.random_instance(15)
+    for location in range(15):
+        tour = [gene for gene in random_tour(15) if gene != location]
+        position = backend.cheapest_insertion(backend.as_tour(tour), backend.as_matrix(rows), location)
+        lengths = [path_length(tour[:i] + [location] + tour[i:], rows) for i in range(len(tour) + 1)]
+        assert path_length(tour[:position] + [location] + tour[position:], rows) \
+            == pytest.approx(min(lengths))
+
+
+def test_nearest_neighbour(backend):
+    rows = kernels.random_instance(20)
+    tour = backend.nearest_neighbour(backend.as_matrix(rows), backend.new_tour(20), backend.new_flags(20))
+
+    current, left = 20, set(range(20))
+    for location in tour:
+        assert rows[current][location] == min(rows[current][other] for other in left)
+        left.remove(location)
+        current = location
+    assert not left
+
+
+@pytest.mark.parametrize('num_locations', range(1, 9))
+def test_exact_tour_and_lower_bound_against_brute_force(backend, num_locations):
+    rows = kernels.random_instance(num_locations)
+    matrix = backend.as_matrix(rows)
+    optimal = min(path_length(tour, rows) for tour in permutations(range(num_locations)))
+
+    tour, distance = backend.exact_tour(matrix)
+    assert sorted(tour) == list(range(num_locations))
+    assert distance == pytest.approx(optimal)
+    assert path_length(list(tour), rows) == pytest.approx(optimal)
+
+    bound = backend.lower_bound(matrix)
+    assert bound <= optimal + 1e-6
+    assert bound >= 0.9 * optimal
+
+
+@pytest.mark.skipif(kernels.numba is None, reason='numba is not installed')
+def test_numba_matches_python():
+    """
+    Same results, ties included, from both backends on the same inputs.
+    """
+    python, numba = kernels.get_backend('python'), kernels.get_backend('numba')
+    rows = kernels.random_instance(40)
+    python_matrix, numba_matrix = python.as_matrix(rows), numba.as_matrix(rows)
+
+    for _ in range(100):
+        parent_a, parent_b = random_tour(40), random_tour(40)
+        start, end = sorted([random.randint(0, 40), random.randint(0, 40)])
+        assert list(numba.crossover(numba.as_tour(parent_a), numba.as_tour(parent_b), start, end)) \
+            == python.crossover(parent_a, parent_b, start, end)
+        assert numba.tour_length(numba.as_tour(parent_a), numba_matrix) \
+            == pytest.approx(python.tour_length(parent_a, python_matrix))
+
+        partial = parent_b[1:]
+        assert numba.cheapest_insertion(numba.as_tour(partial), numba_matrix, parent_b[0]) \
+            == python.cheapest_insertion(partial, python_matrix, parent_b[0])
+
+    assert list(numba.constructive_tour(numba_matrix)[0]) == python.constructive_tour(python_matrix)[0]
@@ -0,0 +1,118 @@
+import settings
+from parallel_simulation import ParallelSimulation
+from simulation import Simulation
+from world import World, Location
+
+
+def make_simulation(num_locations=15, **overrides):
+    config = settings.SimulationConfig(**{
+        'num_generations': 30,
+        'warm_start_generations': 10,
+        'exact_solver_max_locations': 0,
+        'optimality_gap_threshold': None,
+        **overrides,
+    })
+    sim = Simulation(World(num_locations=num_locations), verbose=False, config=config)
+    sim.run_simulation()
+    return sim
+
+
+def assert_valid_generation(sim):
+    names = sorted(location.name for location in sim.world.locations)
+    for individual in sim.generation.individuals:
+        assert sorted(individual.tour) == list(range(len(sim.world.locations)))
+        assert sorted(location.name for location in individual.path) == names
+    assert sim.best_distance == min(individual.distance for individual in sim.generation.individuals)
+
+
+def test_repaired_tours_are_permutations(backend):
+    sim = make_simulation()
+
+    sim.add_location(Location('Extra', 5, 95))
+    assert_valid_generation(sim)
+
+    sim.remove_location(sim.world.locations[4].name)
+    assert_valid_generation(sim)
+
+    sim.move_location(sim.world.locations[0].name, 70, 20)
+    assert_valid_generation(sim)
+
+    sim.reoptimize(num_generations=20)
+    assert_valid_generation(sim)
+
+
+def test_reoptimize_keeps_the_configured_length(backend):
+    sim = make_simulation()
+    sim.add_location(Location('Extra', 5, 95))
+    sim.reoptimize()
+    assert sim.num_generations == sim.config.num_generations
+
+
+def test_removing_every_location(backend):
+    sim = make_simulation(num_locations=3)
+    for location in list(sim.world.locations):
+        sim.remove_location(location.name)
+    assert sim.best_distance == 0
+    assert sim.best_individual.printable_path == [sim.world.hq.name, sim.world.hq.name]
+
+    sim.reoptimize(num_generations=5)
+    assert sim.best_distance == 0
+
+    sim.add_location(Location('Back', 50, 60))
+    assert_valid_generation(sim)
+    assert sim.best_distance == 20
+
+
+def test_parallel_simulation(backend):
+    config = settings.SimulationConfig(
+        population_amount=40, num_generations=20,
+        exact_solver_max_locations=0, optimality_gap_threshold=None)
+    sim = ParallelSimulation(World(num_locations=20), num_processes=2, verbose=False, config=config)
+    sim.run_simulation()
+
+    assert len(sim.best_distances) == 20
+    assert sim.best_distance == min(sim.best_distances)
+    assert sorted(sim.best_individual.tour) == list(range(20))
+    # Its population can't be repaired, so there's nothing to edit the locations with
+    assert not hasattr(sim, 'add_location') and not hasattr(sim, 'reoptimize')
+
+
+class RecordingPipe:
+    def __init__(self):
+        self.events = []
+
+    def send(self, message):
+        self.events.append(('message', message['generation']))
+
+    def close(self):
+        pass
+
+
+def test_first_answer_is_sent_before_the_lower_bound(backend, monkeypatch):
+    config = settings.SimulationConfig(
+        num_generations=5, exact_solver_max_locations=0, optimality_gap_threshold=0.01)
+    sim = Simulation(World(num_locations=25), verbose=False, config=config)
+    pipe = RecordingPipe()
+
+    lower_bound = sim.world.lower_bound
+    def recorded_lower_bound(*args, **kwargs):
+        pipe.events.append(('lower_bound', None))
+        return lower_bound(*args, **kwargs)
+    monkeypatch.setattr(sim.world, 'lower_bound', recorded_lower_bound)
+
+    sim.run_simulation(pipe)
+    assert pipe.events[:2] == [('message', 1), ('lower_bound', None)]
+    assert sim.optimality_gap is not None
+
+
+def test_optimality_gap_with_a_zero_bound(backend):
+    sim = Simulation(
+        World(num_locations=5), verbose=False,
+        config=settings.SimulationConfig(optimality_gap_threshold=0.01))
+    sim.lower_bound = 0.0
+
+    sim.best_distance = 0.0
+    assert sim.reached_optimality_gap() and sim.optimality_gap == 0
+
+    sim.best_distance = 5.0
+    assert not sim.reached_optimality_gap() and sim.optimality_gap == float('inf')
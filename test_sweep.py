@@ -0,0 +1,22 @@
+import sweep
+
+
+def test_grid():
+    assert sweep.grid(elite_amount=[1, 3], population_amount=[50]) == [
+        {'elite_amount': 1, 'population_amount': 50},
+        {'elite_amount': 3, 'population_amount': 50},
+    ]
+
+
+def test_successive_halving(backend):
+    candidates = sweep.grid(elite_amount=[1, 3], population_amount=[20, 30])
+    report = sweep.successive_halving(
+        candidates, sweep.benchmark_worlds(amount=2, num_locations=12),
+        min_generations=10, max_generations=40, num_processes=2)
+
+    # 4 candidates race for 10 generations, 2 of them for 20, and the last one for 40
+    assert [row['rounds'] for row in report] == [3, 2, 1, 1]
+    assert sorted(str(row['config']) for row in report) == sorted(str(overrides) for overrides in candidates)
+    # The ones eliminated in the same round are ranked by their distance
+    assert report[2]['relative_distance'] <= report[3]['relative_distance']
+    assert all(row['relative_distance'] >= 1 for row in report)
@@ -0,0 +1,37 @@
+import pytest
+
+from world import World, Location
+
+
+def assert_same_matrix(matrix, expected):
+    assert len(matrix) == len(expected)
+    for row, expected_row in zip(matrix, expected):
+        assert list(row) == pytest.approx(list(expected_row))
+
+
+def test_location_edits_match_a_fresh_matrix(backend):
+    world = World(num_locations=10)
+    world.distance_matrix  # Built now, so the edits below update it
+
+    world.add_location(Location('Extra', 12, 34))
+    assert_same_matrix(world.distance_matrix, World(locations=world.locations).distance_matrix)
+
+    world.remove_location(world.locations[3].name)
+    assert_same_matrix(world.distance_matrix, World(locations=world.locations).distance_matrix)
+
+    world.move_location(world.locations[0].name, 99, 1)
+    assert_same_matrix(world.distance_matrix, World(locations=world.locations).distance_matrix)
+
+
+def test_location_edits_keep_distances_up_to_date(backend):
+    world = World(num_locations=5)
+    moved = world.locations[0]
+    world.distance_between(moved, world.hq)
+
+    world.move_location(moved.name, 0, 0)
+    assert world.distance_between(moved, world.hq) == pytest.approx((50**2 + 50**2) ** 0.5)
+
+    with pytest.raises(ValueError):
+        world.add_location(Location(world.locations[1].name, 1, 1))
+    with pytest.raises(ValueError):
+        world.remove_location('Nowhere')
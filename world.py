@@ -5,7 +5,8 @@ from decimal import Decimal
 
 from matplotlib import pyplot
 
-from settings import NUM_LOCATIONS, LOCATION_NAME_LIST
+import kernels
+from settings import NUM_LOCATIONS, LOCATION_NAME_LIST, LOWER_BOUND_ITERATIONS
 
 
 class Location:
@@ -23,18 +24,24 @@ class World:
     Mainly a collection of Locations, although also contains some
     util methods.
     """
-    def __init__(self, width=100, height=100, num_locations=NUM_LOCATIONS):
+    def __init__(self, width=100, height=100, num_locations=NUM_LOCATIONS, locations=None):
         self.width = width
         self.height = height
         self.locations = []
         self.cached_distances = {}
-
-        randomized_names = sample(LOCATION_NAME_LIST, num_locations)
-
-        self.locations = [
-            Location(name, randint(0, width), randint(0, height))
-            for name in randomized_names
-        ]
+        self.cached_matrix = None
+        self.cached_indices = None
+
+        if locations is not None:
+            # Pre-set locations, i.e. a real stop list instead of a random map
+            self.locations = list(locations)
+        else:
+            randomized_names = sample(LOCATION_NAME_LIST, num_locations)
+
+            self.locations = [
+                Location(name, randint(0, width), randint(0, height))
+                for name in randomized_names
+            ]
         self.hq = Location('Original city', self.width/2, self.height/2)
 
     @property
@@ -58,7 +65,7 @@ class World:
         Remember the Pythagorean theorem? Exactly.
         Caches the value since this will be called many times.
         """
-        cache_name = location_a.name+location_b.name
+        cache_name = (location_a.name, location_b.name)
         if cache_name in self.cached_distances:
             return self.cached_distances[cache_name]
         
@@ -68,6 +75,111 @@ class World:
         self.cached_distances[cache_name] = sqrt((x_a-x_b)**2 + (y_a-y_b)**2)
         return self.cached_distances[cache_name]
 
+    @property
+    def distance_matrix(self):
+        """
+        Distances between every pair of locations, in the format of
+        kernels.get_backend(). Rows follow `locations_with_hq`,
+        so the HQ is the last one.
+        """
+        if self.cached_matrix is None:
+            # Not going through distance_between(), whose cache would hold
+            # a million entries for a thousand locations
+            all_locations = self.locations_with_hq
+            self.cached_matrix = kernels.get_backend().as_matrix([
+                [
+                    sqrt((location_a.x_coord-location_b.x_coord)**2 + (location_a.y_coord-location_b.y_coord)**2)
+                    for location_b in all_locations
+                ]
+                for location_a in all_locations
+            ])
+        return self.cached_matrix
+
+    def indices_of(self, path):
+        """
+        Translates a path of Locations into a path of indices (of `locations`).
+        Indexes by name, so Locations which went through a pipe still match.
+        """
+        indices = self.indices_by_name()
+        return [indices[location.name] for location in path]
+
+    def path_from_indices(self, indices):
+        return [self.locations[index] for index in indices]
+
+    def can_be_solved_exactly(self, max_locations):
+        return len(self.locations) <= min(max_locations, kernels.get_backend().max_exact_locations)
+
+    def exact_solution(self):
+        """
+        Optimal tour (without the HQ on the edges) and its distance.
+        Takes exponential time, so only for a few locations.
+        """
+        return kernels.get_backend().exact_tour(self.distance_matrix)
+
+    def lower_bound(self, upper_bound=None, iterations=LOWER_BOUND_ITERATIONS):
+        """
+        A distance no path can beat. `upper_bound`, the distance of a known
+        path, helps only if it's shorter than a nearest neighbour + 2-opt one.
+        """
+        return kernels.get_backend().lower_bound(self.distance_matrix, upper_bound, iterations)
+
+    def get_location(self, name):
+        location = next((location for location in self.locations if location.name == name), None)
+        if location is None:
+            raise ValueError(f'There is no location called {name}.')
+        return location
+
+    def add_location(self, location):
+        """
+        Adds a new stop to the world. The distance matrix (if already built)
+        gains a row and a column, instead of being entirely rebuilt.
+        """
+        if location.name == self.hq.name or location.name in self.indices_by_name():
+            raise ValueError(f'There is already a location called {location.name}.')
+
+        self.locations.append(location)
+        self.cached_indices = None
+        if self.cached_matrix is not None:
+            self.cached_matrix = kernels.get_backend().matrix_insert(
+                self.cached_matrix, len(self.locations)-1, self.distances_from(location))
+
+    def remove_location(self, name):
+        location = self.get_location(name)
+        index = self.locations.index(location)
+
+        self.locations.pop(index)
+        self.forget_distances(name)
+        self.cached_indices = None
+        if self.cached_matrix is not None:
+            self.cached_matrix = kernels.get_backend().matrix_delete(self.cached_matrix, index)
+        return location
+
+    def move_location(self, name, x, y):
+        location = self.get_location(name)
+        location.x_coord, location.y_coord = x, y
+
+        self.forget_distances(name)
+        if self.cached_matrix is not None:
+            self.cached_matrix = kernels.get_backend().matrix_update(
+                self.cached_matrix, self.locations.index(location), self.distances_from(location))
+        return location
+
+    def distances_from(self, location):
+        return [self.distance_between(location, other) for other in self.locations_with_hq]
+
+    def forget_distances(self, name):
+        self.cached_distances = {
+            cache_name: distance for cache_name, distance in self.cached_distances.items()
+            if name not in cache_name
+        }
+
+    def indices_by_name(self):
+        if self.cached_indices is None:
+            self.cached_indices = {
+                location.name: index for index, location in enumerate(self.locations)
+            }
+        return self.cached_indices
+
     def plot_map(self, axes):
         axes.scatter(
             x=[location.x_coord for location in self.locations],
@@ -104,7 +216,7 @@ class World:
     def configure_plot(self, plot, gen=None):
         def format_e(n):
             return '{:.2e}'.format(n)
-        title = f'{NUM_LOCATIONS} locations, {format_e(self.num_possible_solutions)} possibilities.'
+        title = f'{len(self.locations)} locations, {format_e(self.num_possible_solutions)} possibilities.'
         if gen:
             title += f" Generation {gen}"
         plot.title(title)